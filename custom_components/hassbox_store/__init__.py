@@ -15,6 +15,9 @@ from .const import DOMAIN
 from .base import HassBoxStore
 from .data_client import HassBoxDataClient
 from .utils.store import async_load_from_store
+from .views import HassBoxCardView
+
+CARD_VIEW_REGISTERED = f"{DOMAIN}_card_view"
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> bool:
 
@@ -22,6 +25,18 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     hassbox.hass = hass
     hassbox.session = async_get_clientsession(hass)
     hassbox.config = await async_load_from_store(hass, "hassbox_store.config") or None
-    hassbox.data_client = HassBoxDataClient(hass=hass, config=hassbox.config)
+    hassbox.data_client = HassBoxDataClient(hass=hass, config=hassbox.config, session=async_get_clientsession(hass, verify_ssl=False))
+    hassbox.set_fleet_cache_dir(hassbox.config.get("fleet_cache_dir") if hassbox.config else None)
+    if not hass.data.get(CARD_VIEW_REGISTERED):
+        hass.http.register_view(HassBoxCardView(hass, hass.config.path("www")))
+        hass.data[CARD_VIEW_REGISTERED] = True
     await hassbox.async_update_data()
-    return True
\ No newline at end of file
+    hassbox.schedule_auto_update()
+    return True
+
+async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> bool:
+
+    hassbox: HassBoxStore | None = hass.data.pop(DOMAIN, None)
+    if hassbox is not None:
+        hassbox.cancel_auto_update()
+    return True
@@ -1,32 +1,50 @@
 from __future__ import annotations
 
+import asyncio
 import gzip
 import os
 import shutil
-import zipfile
-import tarfile
 import hashlib
+from collections.abc import Callable
 from typing import Any
+import functools
 import logging
 import time
 import tempfile
 
 from homeassistant.core import HomeAssistant
 from homeassistant.const import __version__ as HAVERSION
-from aiohttp.client import ClientSession, ClientTimeout
+from homeassistant.helpers.event import async_track_time_change
+from aiohttp.client import ClientError, ClientSession, ClientTimeout
 from urllib.parse import urlparse, parse_qs
 from .utils.logger import LOGGER
 from .utils.store import async_save_to_store, async_load_from_store
+from .utils.lovelace import async_update_resources
+from .utils.fleet import FleetCache
+from .utils.archive import ArchiveError, extract_archive
+from .utils.throttle import IOThrottle, move
+from .utils.digest import file_digest
 from packaging.version import parse as parse_version
 
-from .data_client import HassBoxDataClient
-from .const import STORE_ID
+from .data_client import HassBoxDataClient, REQUEST_FAILED
+from .const import (
+    STORE_ID,
+    STORE_VERSION,
+    CARD_URL_PATH,
+    DOWNLOAD_CHUNK_SIZE,
+    MAX_PARALLEL_INSTALLS,
+    AUTO_UPDATE_RATE_LIMIT,
+    DEFAULT_AUTO_UPDATE_HOUR,
+)
 
 class HassBoxStore:
     hass: HomeAssistant | None = None
     session: ClientSession | None = None
     config: dict[str, Any] | None = None
     data_client: HassBoxDataClient | None = None
+    fleet: FleetCache | None = None
+    auto_update_unsub: Callable[[], None] | None = None
+    auto_updating: bool = False
     enable: bool = False
     disabled_reason: str | None = None
     log: logging.Logger = LOGGER
@@ -40,9 +58,16 @@ class HassBoxStore:
         if (last_time_update + 3600 * 24) > time.time() and self.first_time == False:
             return
 
+        result = await self.data_client.get_data()
+        if result.get(REQUEST_FAILED):
+            # Transient failure, keep the current state and retry on the next call.
+            self.log.warning(result.get("errmsg"))
+            if not self.enable:
+                self.disabled_reason = result.get("errmsg")
+            return
+
         self.first_time = False
 
-        result = await self.data_client.get_data()
         if "errcode" in result and result["errcode"] == 1:
             self.enable = False
             self.disabled_reason = result['errmsg']
@@ -58,40 +83,164 @@ class HassBoxStore:
         self.config["message"] = result["message"]
         await async_save_to_store(self.hass, "hassbox_store.config", self.config)
 
-        response = await self.session.get(result["data_source_url"])
-        if response.status != 200:
+        if self.fleet is not None:
+            result = await self.fleet.async_get_catalog(result["data_source_url"], self.async_fetch_catalog)
+        else:
+            result = await self.async_fetch_catalog(result["data_source_url"])
+        if result is None:
             return
-        result = await response.json()
         await async_save_to_store(self.hass, "hassbox_store.repo", result)
 
-    async def async_install_integration(self, repo: dict[str, Any]):
+    async def async_fetch_catalog(self, url):
+        response = await self.session.get(url)
+        if response.status != 200:
+            return None
+        return await response.json()
+
+    def cancel_auto_update(self):
+        if self.auto_update_unsub is not None:
+            self.auto_update_unsub()
+            self.auto_update_unsub = None
+
+    def schedule_auto_update(self):
+        self.cancel_auto_update()
+
+        if not self.config or not self.config.get("auto_update"):
+            return
+
+        self.auto_update_unsub = async_track_time_change(
+            self.hass,
+            self.async_auto_update,
+            hour=self.config.get("auto_update_hour", DEFAULT_AUTO_UPDATE_HOUR),
+            minute=0,
+            second=0,
+        )
+
+    def get_auto_update_repos(self, installedRepoMap: dict[str, Any], repoMap: dict[str, Any]):
+        types = self.config.get("auto_update_types", [])
+        ids = self.config.get("auto_update_repos", [])
+        updateRepos = []
+
+        for id, installedRepo in installedRepoMap.items():
+            if installedRepo["type"] not in types and id not in ids:
+                continue
+            if id in repoMap and self.has_update(installedRepo, repoMap[id]):
+                updateRepos.append(repoMap[id])
+
+        storeRepo = { "id": STORE_ID, "version_name": STORE_VERSION }
+        if STORE_ID in ids and STORE_ID in repoMap and self.has_update(storeRepo, repoMap[STORE_ID]):
+            updateRepos.append(repoMap[STORE_ID])
+
+        return updateRepos
+
+    async def async_auto_update(self, now=None):
+        if self.auto_updating:
+            return
+        self.auto_updating = True
+        try:
+            await self.async_update_data()
+            if not self.enable:
+                return
+
+            installedRepoMap = await async_load_from_store(self.hass, "hassbox_store.installed") or {}
+            repoList = await async_load_from_store(self.hass, "hassbox_store.repo") or []
+            repoMap = {repo["id"]: repo for repo in repoList}
+            updateRepos = self.get_auto_update_repos(installedRepoMap, repoMap)
+            if not updateRepos:
+                return
+
+            self.log.info("Auto updating %s", ", ".join(repo["id"] for repo in updateRepos))
+            results = await self.async_install_integrations(updateRepos, rate_limit=AUTO_UPDATE_RATE_LIMIT)
+
+            for repo, result in zip(updateRepos, results):
+                if not result:
+                    self.log.error("Auto update of %s failed", repo["id"])
+
+            if any(result and repo["type"] == "integration" for repo, result in zip(updateRepos, results)):
+                self.log.info("Integrations were updated, restarting Home Assistant")
+                await self.hass.services.async_call("homeassistant", "restart")
+        finally:
+            self.auto_updating = False
+
+    def set_fleet_cache_dir(self, directory: str | None):
+        self.fleet = FleetCache(self.hass, directory) if directory else None
+
+    async def async_install_integrations(self, repos: list[dict[str, Any]], rate_limit: int | None = None):
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_INSTALLS)
+        throttle = IOThrottle(rate_limit) if rate_limit else None
+
+        async def install(repo):
+            async with semaphore:
+                try:
+                    return await self._async_install_repo(repo, throttle)
+                except Exception:
+                    # One broken repo must not abort the batch before it is committed.
+                    self.log.exception("Could not install %s", repo["id"])
+                    return False
+
+        results = await asyncio.gather(*(install(repo) for repo in repos))
+        card_resources = {}
+        installed_repos = []
+        for repo, installed in zip(repos, results):
+            if not installed:
+                continue
+            if repo["type"] == "card":
+                resource_url = self.get_card_resource_url(repo)
+                card_resources[resource_url] = self.get_card_versioned_url(repo)
+            if repo["id"] != STORE_ID:
+                installed_repos.append(repo)
+
+        await async_update_resources(self.hass, upserts=card_resources)
+
+        if installed_repos:
+            result = await async_load_from_store(self.hass, "hassbox_store.installed") or {}
+            for repo in installed_repos:
+                result[repo['id']] = repo
+            await async_save_to_store(self.hass, "hassbox_store.installed", result)
+
+        return list(results)
+
+    async def _async_install_repo(self, repo: dict[str, Any], throttle: IOThrottle | None = None):
         repo_version = self.get_repo_version(repo)
         if repo_version is None:
             self.log.error("%s without version", repo['id'])
             return False
         
         assets_download_url = "https://get.hassbox.cn/integration/" + repo["id"] + "/" + repo_version["name"] + "/" + repo_version["assets_name"]
-        filecontent = await self.async_download_file(assets_download_url)
-        if filecontent is None:
-            self.log.error("%s was not downloaded", assets_download_url)
-            return False
-        
         temp_assets_dir = await self.hass.async_add_executor_job(tempfile.mkdtemp)
-        temp_assets_file = f"{temp_assets_dir}/{repo_version['assets_name']}"
-        result = await self.async_save_file(temp_assets_file, filecontent)
-        if not result:
-            self.log.error("Could not save download file")
-            return False
-        
-        assets_filename = repo_version['assets_name'].split('.')[0]
-        temp_assets_extract_dir = f"{temp_assets_dir}/{assets_filename}"
-        if repo_version['assets_name'].endswith('.zip'):
-            with zipfile.ZipFile(temp_assets_file, "r") as zip_file:
-                zip_file.extractall(temp_assets_extract_dir)
-        elif repo_version['assets_name'].endswith('.tar.gz'):
-            tar = tarfile.open(temp_assets_file)
-            tar.extractall(path = temp_assets_extract_dir)
+        try:
+            temp_assets_file = f"{temp_assets_dir}/{repo_version['assets_name']}"
+            download = functools.partial(self.async_download_to_file, throttle=throttle)
+            if self.fleet is not None:
+                assets_hash = await self.fleet.async_get_asset(repo["id"], assets_download_url, temp_assets_file, download)
+            else:
+                assets_hash = await download(assets_download_url, temp_assets_file)
+            if assets_hash is None:
+                self.log.error("%s was not downloaded", assets_download_url)
+                return False
+
+            assets_filename = repo_version['assets_name'].split('.')[0]
+            temp_assets_extract_dir = f"{temp_assets_dir}/{assets_filename}"
+            if repo_version['assets_name'].endswith(('.zip', '.tar.gz')):
+                try:
+                    await self.hass.async_add_executor_job(extract_archive, temp_assets_file, temp_assets_extract_dir, throttle)
+                except (ArchiveError, OSError) as error:
+                    self.log.error("Could not extract %s - %s", repo_version['assets_name'], error)
+                    return False
+
+            installed = await self.hass.async_add_executor_job(
+                self.install_assets, repo, repo_version, temp_assets_file, temp_assets_extract_dir, assets_hash, throttle
+            )
+            if installed:
+                repo['version_name'] = repo_version['name']
+                repo.pop('version_simple', None)
 
+            return installed
+        finally:
+            await self.hass.async_add_executor_job(shutil.rmtree, temp_assets_dir, True)
+
+    def install_assets(self, repo, repo_version, temp_assets_file, temp_assets_extract_dir, assets_hash, throttle=None):
+        """Move downloaded assets into place, runs in the executor."""
         hassConfigPath = self.hass.config.path()
         installed = False
 
@@ -107,7 +256,7 @@ class HassBoxStore:
                         local_dir = f"{component_directory}/{component_name}"
                         if os.path.exists(local_dir):
                             shutil.rmtree(local_dir)
-                        shutil.move(root, component_directory)
+                        move(root, component_directory, throttle)
                         found_component = True
                         break
 
@@ -123,7 +272,7 @@ class HassBoxStore:
                                 local_dir = f"{component_directory}/{component_name}"
                                 if os.path.exists(local_dir):
                                     shutil.rmtree(local_dir)
-                                shutil.move(os.path.join(root, d, file), component_directory)
+                                move(os.path.join(root, d, file), component_directory, throttle)
                                 found_component = True
 
             if found_component:
@@ -141,10 +290,10 @@ class HassBoxStore:
                         files = os.listdir(os.path.join(root, d))
                         for file in files:
                             if file.endswith(".yaml"):
-                                await self.async_replace_file(os.path.join(root, d, file), "hacsfiles", "local")
+                                self.replace_file(os.path.join(root, d, file), "hacsfiles", "local")
                             if not os.path.exists(theme_directory):
                                 os.makedirs(theme_directory)
-                            shutil.move(os.path.join(root, d, file), os.path.join(theme_directory, file))
+                            move(os.path.join(root, d, file), os.path.join(theme_directory, file), throttle)
                         found_theme = True
             
             if found_theme:
@@ -154,6 +303,7 @@ class HassBoxStore:
         elif repo["type"] == "card":
             card_directory = f"{hassConfigPath}/www/{repo['id'].split('/')[1]}"
             card_name = None
+            card_hash = None
             found_card = False
 
             if repo_version['assets_name'].endswith('.js'):
@@ -163,12 +313,9 @@ class HassBoxStore:
                 local_file = f"{card_directory}/{card_name}"
                 if os.path.exists(local_file):
                     os.remove(local_file)
-                shutil.move(temp_assets_file, local_file)
-
-                with open(local_file, "rb") as f_in:
-                    with gzip.open(local_file + ".gz", "wb") as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-
+                move(temp_assets_file, local_file, throttle)
+                self.gzip_file(local_file, throttle)
+                card_hash = assets_hash
                 found_card = True
             else :
                 if repo_version.get("filename"):
@@ -193,147 +340,154 @@ class HassBoxStore:
                                     local_file = f"{card_directory}/{card_name}"
                                     if os.path.exists(local_file):
                                         os.remove(local_file)
-                                    shutil.move(os.path.join(root, file), local_file)
-
-                                    with open(local_file, "rb") as f_in:
-                                        with gzip.open(local_file + ".gz", "wb") as f_out:
-                                            shutil.copyfileobj(f_in, f_out)
-                                            
+                                    move(os.path.join(root, file), local_file, throttle)
+                                    card_hash = self.gzip_file(local_file, throttle)
                                     found_card = True
                                     break
 
             if found_card:
                 repo["card_directory"] = card_directory
                 repo["card_name"] = card_name
+                repo["card_hash"] = card_hash
                 installed = True
-                resource_url = "/local/" + repo['id'].split('/')[1] + "/" + card_name
-                lovelace_resources = await async_load_from_store(self.hass, "lovelace_resources") or {}
-                installedBefore = False
-                if lovelace_resources.get("items"):
-                    for item in lovelace_resources["items"]:
-                        if item["url"].startswith(resource_url):
-                            item["url"] = resource_url + "?tag=" + str(int(time.time()))
-                            installedBefore = True
-                            break
-                else:
-                    lovelace_resources["items"] = []
-
-                if not installedBefore:
-                    resource_url = resource_url + "?tag=" + str(int(time.time()))
-                    id = await self.get_md5(resource_url)
-                    lovelace_resources["items"].append({"url": resource_url, "type": "module", "id": id })
-                await async_save_to_store(self.hass, "lovelace_resources", lovelace_resources)
-
-        if installed and repo["id"] != STORE_ID:
-            result = await async_load_from_store(self.hass, "hassbox_store.installed") or {}
-            repo['version_name'] = repo_version['name']
-            del repo['version_simple']
-            result[repo['id']] = repo
-            await async_save_to_store(self.hass, "hassbox_store.installed", result)
-
-        def cleanup_temp_assets_dir():
-            if os.path.exists(temp_assets_dir):
-                shutil.rmtree(temp_assets_dir)
 
-        await self.hass.async_add_executor_job(cleanup_temp_assets_dir)
-            
         return installed
     
-    async def async_delete_integration(self, repo: dict[str, Any]):
-        local_dir = None
-        if repo["type"] == "integration":
-            local_dir = repo["component_directory"]
-            
-        elif repo["type"] == "theme":
-            local_dir = repo["theme_directory"]
+    async def async_delete_integrations(self, repos: list[dict[str, Any]]):
+        local_dirs = []
+        card_resource_urls = set()
+        for repo in repos:
+            if repo["type"] == "integration":
+                local_dirs.append(repo["component_directory"])
 
-        elif repo["type"] == "card":
-            local_dir = repo["card_directory"]
-            resource_url = "/local/" + repo['id'].split('/')[1] + "/" + repo['card_name']
-            lovelace_resources = await async_load_from_store(self.hass, "lovelace_resources") or {}
-            item_id = None
-            for item in lovelace_resources["items"]:
-                if item["url"].startswith(resource_url):
-                    item_id = item["id"]
-                    break
-            
-            if item_id:
-                lovelace_resources["items"] = [d for d in lovelace_resources["items"] if d['id'] != item_id]
-                await async_save_to_store(self.hass, "lovelace_resources", lovelace_resources)
+            elif repo["type"] == "theme":
+                local_dirs.append(repo["theme_directory"])
 
-        if local_dir:
+            elif repo["type"] == "card":
+                local_dirs.append(repo["card_directory"])
+                card_resource_urls.add(self.get_card_resource_url(repo))
+
+        await async_update_resources(self.hass, removals=card_resource_urls)
+
+        def remove_local_dir(local_dir):
             if os.path.exists(local_dir):
                 shutil.rmtree(local_dir)
 
+        await asyncio.gather(
+            *(self.hass.async_add_executor_job(remove_local_dir, local_dir) for local_dir in local_dirs if local_dir)
+        )
+
         result = await async_load_from_store(self.hass, "hassbox_store.installed") or {}
-        result.pop(repo["id"])
+        for repo in repos:
+            result.pop(repo["id"], None)
         await async_save_to_store(self.hass, "hassbox_store.installed", result)
 
+        deleted_ids = {repo["id"] for repo in repos}
+        auto_update_repos = self.config.get("auto_update_repos", [])
+        if any(id in deleted_ids for id in auto_update_repos):
+            self.config["auto_update_repos"] = [id for id in auto_update_repos if id not in deleted_ids]
+            await async_save_to_store(self.hass, "hassbox_store.config", self.config)
+
         return True
     
-    async def async_download_file(self, url):
+    async def async_download_to_file(self, url, file_path, throttle=None):
+        """Stream url to file_path and return the sha256 digest of its content.
+
+        throttle caps the download and disk write speed.
+        """
         if url is None:
             return None
 
+        digest = hashlib.sha256()
+        file = None
         try:
-            request = await self.session.get(
+            file = await self.hass.async_add_executor_job(open, file_path, "wb")
+            async with self.session.get(
                 url=url,
-                timeout=ClientTimeout(total=30)
-            )
-
-            if request.status == 200:
-                return await request.read()
+                timeout=ClientTimeout(total=None if throttle else 120, sock_read=30)
+            ) as response:
+                if response.status != 200:
+                    return None
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    await self.hass.async_add_executor_job(file.write, chunk)
+                    if throttle is not None:
+                        delay = throttle.reserve(len(chunk))
+                        if delay > 0:
+                            await asyncio.sleep(delay)
 
         except (
-            BaseException
+            ClientError, asyncio.TimeoutError, OSError
         ) as exception:
             self.log.error("Download failed - %s", exception)
-        return None
-    
-    async def async_save_file(self, file_path, content):
+            return None
+        finally:
+            if file is not None:
+                await self.hass.async_add_executor_job(file.close)
 
-        def _write_file():
-            with open(
-                file_path,
-                mode="w" if isinstance(content, str) else "wb",
-                encoding="utf-8" if isinstance(content, str) else None,
-                errors="ignore" if isinstance(content, str) else None,
-            ) as file_handler:
-                file_handler.write(content)
+        return digest.hexdigest()
 
+    def replace_file(self, file_path, search_text, replace_text):
         try:
-            await self.hass.async_add_executor_job(_write_file)
-        except (
-            BaseException
-        ) as error:
-            self.log.error("Could not write data to %s - %s", file_path, error)
-            return False
-
-        return os.path.exists(file_path)
-    
-    async def async_replace_file(self, file_path, search_text, replace_text):
-
-        def _replace_file():
             with open(file_path, 'r') as file :
                 filedata = file.read()
             filedata = filedata.replace(search_text, replace_text)
             with open(file_path, 'w') as file:
                 file.write(filedata)
-
-        try:
-            await self.hass.async_add_executor_job(_replace_file)
         except (
-            BaseException
+            OSError, UnicodeError
         ) as error:
             self.log.error("Could not replace %s to %s - %s", search_text, file_path, error)
             return False
 
         return True
     
-    async def get_md5(self, data):
-        m = hashlib.md5()
-        m.update(data.encode())
-        return m.hexdigest()
+    def gzip_file(self, file_path, throttle=None):
+        """Write file_path.gz and return the sha256 digest of file_path in the same pass."""
+        with gzip.open(file_path + ".gz", "wb") as f_out:
+
+            def write_chunk(chunk):
+                if throttle is not None:
+                    throttle.consume(len(chunk))
+                f_out.write(chunk)
+
+            return file_digest(file_path, write_chunk)
+
+    def get_card_resource_url(self, repo: dict[str, Any]):
+        if self.config and self.config.get("card_cache_headers"):
+            prefix = CARD_URL_PATH + "/"
+        else:
+            prefix = "/local/"
+        return prefix + repo['id'].split('/')[1] + "/" + repo['card_name']
+
+    def get_card_versioned_url(self, repo: dict[str, Any]):
+        return self.get_card_resource_url(repo) + "?tag=" + repo["card_hash"][:16]
+
+    async def async_update_card_resources(self, repos: list[dict[str, Any]]):
+        card_resources = {}
+        hashed_repos = []
+        for repo in repos:
+            if repo["type"] != "card":
+                continue
+            if not repo.get("card_hash"):
+                # Cards installed before content hashing have no digest yet.
+                try:
+                    repo["card_hash"] = await self.hass.async_add_executor_job(
+                        file_digest, f"{repo['card_directory']}/{repo['card_name']}"
+                    )
+                except OSError as error:
+                    self.log.error("Could not hash %s - %s", repo["id"], error)
+                    continue
+                hashed_repos.append(repo)
+            card_resources[self.get_card_resource_url(repo)] = self.get_card_versioned_url(repo)
+        await async_update_resources(self.hass, upserts=card_resources)
+
+        if hashed_repos:
+            result = await async_load_from_store(self.hass, "hassbox_store.installed") or {}
+            for repo in hashed_repos:
+                if repo["id"] in result:
+                    result[repo["id"]]["card_hash"] = repo["card_hash"]
+            await async_save_to_store(self.hass, "hassbox_store.installed", result)
 
     def get_repo_version(self, repo: dict[str, Any]):
         for version in repo['version_simple']:
@@ -1,4 +1,6 @@
 
+import os
+
 import voluptuous as vol
 
 from homeassistant import config_entries
@@ -6,7 +8,7 @@ from homeassistant.core import callback
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.selector import selector
 
-from .const import DOMAIN, STORE_VERSION, STORE_ID
+from .const import DOMAIN, STORE_VERSION, STORE_ID, DEFAULT_AUTO_UPDATE_HOUR
 from .data_client import HassBoxDataClient
 from .base import HassBoxStore
 from .utils.store import async_load_from_store, async_save_to_store
@@ -26,7 +28,7 @@ class HassBoxStoreConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return self.async_abort(reason="single_instance_allowed")
 
         config = await async_load_from_store(self.hass, "hassbox_store.config") or None
-        self.data_client = HassBoxDataClient(hass=self.hass, config=config)
+        self.data_client = HassBoxDataClient(hass=self.hass, config=config, session=async_get_clientsession(self.hass, verify_ssl=False))
         result = await self.data_client.get_qrcode()
         
         if "errcode" in result and result["errcode"] == 200:
@@ -107,6 +109,8 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         if has_update > 0:
             options["update_integration"] = "有 " + str(has_update) + " 个更新！"
 
+        options["settings"] = "设置"
+
         message = self.hassbox.config["message"]
 
         return self.async_show_menu(
@@ -267,11 +271,71 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             description_placeholders={'version_incompatible': version_incompatible}
         )
 
+    async def async_step_settings(self, user_input=None):
+        errors = {}
+
+        if user_input is not None:
+            user_input["fleet_cache_dir"] = user_input.get("fleet_cache_dir", "").strip()
+            if user_input["fleet_cache_dir"] and not await self.hass.async_add_executor_job(
+                self.is_valid_cache_dir, user_input["fleet_cache_dir"]
+            ):
+                errors["fleet_cache_dir"] = "fleet_cache_dir_invalid"
+
+        if user_input is not None and not errors:
+            card_cache_headers_changed = user_input["card_cache_headers"] != self.hassbox.config.get("card_cache_headers", False)
+            self.hassbox.config.update(user_input)
+            await async_save_to_store(self.hass, "hassbox_store.config", self.hassbox.config)
+            self.hassbox.set_fleet_cache_dir(user_input["fleet_cache_dir"])
+            self.hassbox.schedule_auto_update()
+            if card_cache_headers_changed:
+                await self.hassbox.async_update_card_resources(self.installedRepoList)
+            return self.async_abort(reason="settings_saved")
+
+        repoOptions = [{"label": "HassBox集成商店", "value": STORE_ID}]
+        for installedRepo in self.installedRepoList:
+            repoOptions.append({"label": installedRepo["name"], "value": installedRepo["id"]})
+
+        repoIds = {option["value"] for option in repoOptions}
+        values = {**self.hassbox.config, **(user_input or {})}
+        data_schema = {
+            vol.Required("card_cache_headers", default=values.get("card_cache_headers", False)): bool,
+            vol.Optional("fleet_cache_dir", default=values.get("fleet_cache_dir", "")): str,
+            vol.Required("auto_update", default=values.get("auto_update", False)): bool,
+            vol.Required("auto_update_hour", default=values.get("auto_update_hour", DEFAULT_AUTO_UPDATE_HOUR)): vol.All(vol.Coerce(int), vol.Range(min=0, max=23)),
+            vol.Optional("auto_update_types", default=values.get("auto_update_types", [])) : selector({
+                "select": {
+                    "options": [
+                        {"label": "集成", "value": "integration"},
+                        {"label": "卡片", "value": "card"},
+                        {"label": "主题", "value": "theme"},
+                    ],
+                    "mode": "list",
+                    "multiple": True
+                }
+            }),
+            vol.Optional("auto_update_repos", default=[id for id in values.get("auto_update_repos", []) if id in repoIds]) : selector({
+                "select": {
+                    "options": repoOptions,
+                    "mode": "dropdown",
+                    "multiple": True
+                }
+            }),
+        }
+
+        return self.async_show_form(
+            step_id="settings",
+            data_schema=vol.Schema(data_schema),
+            errors=errors
+        )
+
+    def is_valid_cache_dir(self, directory):
+        return os.path.isabs(directory) and os.path.isdir(directory) and os.access(directory, os.W_OK | os.X_OK)
+
     async def async_step_install(self, selectedRepos, type):
         install_success = ""
         install_failure = ""
-        for repo in selectedRepos:
-            result = await self.hassbox.async_install_integration(repo)
+        results = await self.hassbox.async_install_integrations(selectedRepos)
+        for repo, result in zip(selectedRepos, results):
             if result:
                 install_success += "* " + repo["name"] + (repo["extra"] if repo.get("extra") else "") + "\n"
             else :
@@ -284,8 +348,8 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             
     async def async_step_delete(self, selectedRepos):
         delete_message = ""
+        await self.hassbox.async_delete_integrations(selectedRepos)
         for repo in selectedRepos:
-            await self.hassbox.async_delete_integration(repo)
             delete_message += "* " + repo["name"] + "\n"
 
         return self.async_abort(reason="reboot", description_placeholders={'message': delete_message},)
@@ -3,3 +3,8 @@ PACKAGE_NAME = "custom_components.hassbox_store"
 STORE_VERSION = "0.0.2"
 STORE_ID = "hass-box/hassbox-store"
 VERSION_STORAGE = 1
+CARD_URL_PATH = "/hassbox_store/cards"
+DOWNLOAD_CHUNK_SIZE = 65536
+MAX_PARALLEL_INSTALLS = 3
+AUTO_UPDATE_RATE_LIMIT = 1024 * 1024
+DEFAULT_AUTO_UPDATE_HOUR = 4
@@ -1,4 +1,6 @@
+import asyncio
 import json
+import time
 import aiohttp
 
 from .utils.logger import LOGGER
@@ -10,29 +12,109 @@ def json_dumps(data):
 base_url = "https://hassbox.cn/api/public/"
 app_id = "gh_07ec63f43481"
 
+# Seconds before a request to the endpoint is abandoned.
+ENDPOINT_TIMEOUTS = {
+    "store/getQRCode": 10,
+    "store/checkState": 10,
+    "store/data": 30,
+}
+DEFAULT_TIMEOUT = 15
+
+# Endpoints whose responses are reused for a short while, in seconds.
+ENDPOINT_CACHE_TTL = {
+    "store/data": 60,
+}
+
+# Set on the result when the client gave up, as opposed to an error reply from the server.
+REQUEST_FAILED = "request_failed"
+
+RETRY_DELAYS = (1, 2, 4)
+RATE_LIMIT_PER_SECOND = 1
+RATE_LIMIT_BURST = 5
+
+
+class TokenBucket:
+    """Allow rate requests per second with bursts of up to capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
 class HassBoxDataClient:
     hass = None
     session = None
     token = None
 
-    def __init__(self, hass, config=None):
+    def __init__(self, hass, config=None, session=None, url=base_url):
         self.hass = hass
-        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False))
+        self.base_url = url
+        self.session = session or aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False))
+        self.bucket = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+        self.inflight = {}
+        self.cache = {}
         if config is not None:
-            LOGGER.error(config["token"])
             self.token = config["token"]
 
     async def __fetch(self, api, data, header=None):
         data["appId"] = app_id
-        async with self.session.post(base_url + api, json=data) as response:
-            result = await response.json()
-            LOGGER.error(json_dumps(result))
-            return result
+        key = api + json_dumps(data)
+
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Identical requests already on the wire share one response.
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.__request(api, data))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        result = await asyncio.shield(task)
+        ttl = ENDPOINT_CACHE_TTL.get(api)
+        if ttl and "errmsg" not in result:
+            self.cache[key] = (time.monotonic() + ttl, result)
+        return result
+
+    async def __request(self, api, data):
+        timeout = aiohttp.ClientTimeout(total=ENDPOINT_TIMEOUTS.get(api, DEFAULT_TIMEOUT))
+        error = None
+        for delay in (0,) + RETRY_DELAYS:
+            if delay:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+            try:
+                async with self.session.post(self.base_url + api, json=data, timeout=timeout) as response:
+                    if response.status < 500:
+                        result = await response.json(content_type=None)
+                        LOGGER.debug("%s - %s", api, json_dumps(result))
+                        return result
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exception:
+                error = exception
+            LOGGER.debug("%s failed - %s", api, error)
+
+        LOGGER.error("Request %s failed - %s", api, error)
+        return {"errcode": -1, "errmsg": f"{api} request failed - {error}", REQUEST_FAILED: True}
 
     async def get_qrcode(self):
         poat_data = { "token": self.token }
         result = await self.__fetch("store/getQRCode", poat_data)
-        LOGGER.error(json_dumps(result))
         if "token" in result:
             self.token = result["token"]
         return result
@@ -40,16 +122,16 @@ class HassBoxDataClient:
     async def check_state(self):
         post_data = {"token": self.token}
         result = await self.__fetch("store/checkState", post_data)
-        LOGGER.error(json_dumps(result))
         if "token" in result:
             self.token = result["token"]
+            self.cache.clear()
             await async_save_to_store(
                 self.hass, "hassbox_store.config", {"token": result["token"]}
             )
             return {"errcode": 0}
         else:
             return {"errcode": 1, "errmsg": result["errmsg"]}
-    
+
     async def get_data(self):
         post_data = {"token": self.token}
         return await self.__fetch("store/data", post_data)
@@ -0,0 +1,120 @@
+"""Bounded archive extraction."""
+from __future__ import annotations
+
+import os
+import shutil
+import tarfile
+import zipfile
+
+from ..const import DOWNLOAD_CHUNK_SIZE
+from .throttle import IOThrottle
+
+MAX_EXTRACT_SIZE = 200 * 1024 * 1024
+MAX_MEMBERS = 10000
+MAX_COMPRESSION_RATIO = 100
+
+
+class ArchiveError(Exception):
+    """Raised when an archive is unsafe or exceeds the extraction limits."""
+
+
+class _Budget:
+    """Cumulative byte and member budget for one archive."""
+
+    def __init__(self, compressed_size: int) -> None:
+        self.members = 0
+        self.size = 0
+        # The overall ratio check needs a floor so tiny archives still extract.
+        self.max_size = min(
+            MAX_EXTRACT_SIZE,
+            max(compressed_size, DOWNLOAD_CHUNK_SIZE) * MAX_COMPRESSION_RATIO,
+        )
+
+    def add_member(self) -> None:
+        self.members += 1
+        if self.members > MAX_MEMBERS:
+            raise ArchiveError(f"Archive has more than {MAX_MEMBERS} members")
+
+    def add_bytes(self, size: int) -> None:
+        self.size += size
+        if self.size > self.max_size:
+            raise ArchiveError(f"Archive expands to more than {self.max_size} bytes")
+
+
+def _target_path(dest: str, name: str) -> str:
+    """Return where name extracts to, rejecting paths that leave dest."""
+    if not name or os.path.isabs(name) or name.startswith(("/", "\\")):
+        raise ArchiveError(f"Unsafe member path {name!r}")
+    target = os.path.realpath(os.path.join(dest, name))
+    if os.path.commonpath([dest, target]) != dest:
+        raise ArchiveError(f"Member {name!r} escapes the extract directory")
+    return target
+
+
+def _copy(source, target: str, budget: _Budget, limit: int | None = None, throttle: IOThrottle | None = None) -> None:
+    """Stream source into target, counting real bytes rather than header sizes."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    written = 0
+    with open(target, "wb") as file:
+        for chunk in iter(lambda: source.read(DOWNLOAD_CHUNK_SIZE), b""):
+            written += len(chunk)
+            if limit is not None and written > limit:
+                raise ArchiveError(f"{target} is larger than its header declares")
+            budget.add_bytes(len(chunk))
+            if throttle is not None:
+                throttle.consume(len(chunk))
+            file.write(chunk)
+
+
+def _extract_zip(file_path: str, dest: str, budget: _Budget, throttle: IOThrottle | None) -> None:
+    with zipfile.ZipFile(file_path, "r") as zip_file:
+        for info in zip_file.infolist():
+            budget.add_member()
+            target = _target_path(dest, info.filename)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            if info.file_size > MAX_COMPRESSION_RATIO * max(info.compress_size, 1) and info.file_size > DOWNLOAD_CHUNK_SIZE:
+                raise ArchiveError(f"Member {info.filename!r} exceeds the compression ratio limit")
+            with zip_file.open(info) as source:
+                _copy(source, target, budget, info.file_size, throttle)
+
+
+def _extract_tar(file_path: str, dest: str, budget: _Budget, throttle: IOThrottle | None) -> None:
+    # Stream mode reads members in order without indexing the whole archive.
+    with tarfile.open(file_path, mode="r|*") as tar:
+        for member in tar:
+            budget.add_member()
+            target = _target_path(dest, member.name)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            if not member.isfile():
+                # Links and device files are never needed by a package.
+                continue
+            source = tar.extractfile(member)
+            with source:
+                _copy(source, target, budget, member.size, throttle)
+
+
+def extract_archive(file_path: str, dest: str, throttle: IOThrottle | None = None) -> None:
+    """Extract a .zip or .tar.gz file into dest within the size limits.
+
+    Partially extracted files are removed when the archive is rejected.
+    """
+    dest = os.path.realpath(dest)
+    os.makedirs(dest, exist_ok=True)
+    budget = _Budget(os.path.getsize(file_path))
+    try:
+        if file_path.endswith(".zip"):
+            _extract_zip(file_path, dest, budget, throttle)
+        elif file_path.endswith(".tar.gz"):
+            _extract_tar(file_path, dest, budget, throttle)
+        else:
+            raise ArchiveError(f"Unsupported archive {os.path.basename(file_path)}")
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as error:
+        shutil.rmtree(dest, ignore_errors=True)
+        raise ArchiveError(f"Corrupt archive - {error}") from error
+    except BaseException:
+        shutil.rmtree(dest, ignore_errors=True)
+        raise
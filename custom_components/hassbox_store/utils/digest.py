@@ -0,0 +1,21 @@
+"""Content digests."""
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Callable
+
+from ..const import DOWNLOAD_CHUNK_SIZE
+
+
+def file_digest(file_path: str, on_chunk: Callable[[bytes], None] | None = None) -> str:
+    """Return the sha256 hex digest of file_path.
+
+    on_chunk receives every chunk as it is read, so a copy can share the pass.
+    """
+    m = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+            m.update(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+    return m.hexdigest()
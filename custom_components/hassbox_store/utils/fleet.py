@@ -0,0 +1,244 @@
+"""Shared catalog and asset cache for several Home Assistant instances."""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+
+from .digest import file_digest
+from .logger import LOGGER
+
+_LOGGER = LOGGER
+
+CATALOG_MAX_AGE = 3600 * 24
+# Versions of one repo kept in the cache, older ones are pruned on commit.
+ASSET_KEEP_VERSIONS = 2
+LOCK_TIMEOUT = 300
+LOCK_POLL_INTERVAL = 1
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+def _remove_file(file_path: str) -> None:
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _read_text(file_path: str) -> str | None:
+    try:
+        with open(file_path, encoding="utf-8") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def _write_text(file_path: str, text: str) -> None:
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temp_path, file_path)
+
+
+class FleetCache:
+    """A cache directory shared by every instance of a fleet.
+
+    Each entry is written once under an exclusive file lock and stored next
+    to a .sha256 file, other instances verify the digest before reusing it.
+    """
+
+    def __init__(self, hass: HomeAssistant, directory: str) -> None:
+        self.hass = hass
+        self.directory = directory
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def _try_lock(self, name: str):
+        lock_dir = self._path("locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        lock_file = open(os.path.join(lock_dir, f"{name}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        except OSError:
+            lock_file.close()
+            raise
+        return lock_file
+
+    def _unlock(self, lock_file) -> None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError as error:
+            _LOGGER.warning("Could not release fleet lock %s - %s", lock_file.name, error)
+        finally:
+            lock_file.close()
+
+    async def _async_job(self, target: Callable[..., Any], *args: Any) -> tuple[bool, Any]:
+        """Run a cache directory job, returning False instead of raising OSError."""
+        try:
+            return True, await self.hass.async_add_executor_job(target, *args)
+        except OSError as error:
+            _LOGGER.warning("Fleet cache %s is unavailable - %s", self.directory, error)
+            return False, None
+
+    async def _async_lock(self, name: str):
+        """Wait for the fleet lock without blocking an executor thread.
+
+        Returns None when the lock can not be taken, callers then skip the cache.
+        """
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            ok, lock_file = await self._async_job(self._try_lock, name)
+            if not ok:
+                return None
+            if lock_file is not None:
+                return lock_file
+            if time.monotonic() > deadline:
+                _LOGGER.warning("Timed out waiting for the fleet lock %s", name)
+                return None
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    def _verified(self, file_path: str) -> str | None:
+        """Return the digest of file_path if it matches its .sha256 file."""
+        if not os.path.isfile(file_path):
+            return None
+        expected = _read_text(f"{file_path}.sha256")
+        digest = file_digest(file_path)
+        if expected != digest:
+            _LOGGER.warning("Fleet cache entry %s failed verification", file_path)
+            return None
+        return digest
+
+    def _load_catalog(self, file_path: str) -> Any:
+        if self._verified(file_path) is None:
+            return None
+        if os.path.getmtime(file_path) + CATALOG_MAX_AGE < time.time():
+            return None
+        with open(file_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def _save_catalog(self, file_path: str, catalog: Any) -> None:
+        catalog_dir = os.path.dirname(file_path)
+        os.makedirs(catalog_dir, exist_ok=True)
+        text = json.dumps(catalog, ensure_ascii=False)
+        _write_text(file_path, text)
+        _write_text(f"{file_path}.sha256", hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+        # Catalogs of a previous data_source_url are never read again.
+        for name in os.listdir(catalog_dir):
+            path = os.path.join(catalog_dir, name)
+            if not path.startswith(file_path) and os.path.getmtime(path) + CATALOG_MAX_AGE < time.time():
+                _remove_file(path)
+
+    async def async_get_catalog(
+        self, url: str, fetch: Callable[[str], Awaitable[Any]]
+    ) -> Any:
+        """Return the catalog at url, fetching it only if no instance did recently.
+
+        An unusable cache directory falls back to fetching directly.
+        """
+        key = _url_key(url)
+        file_path = self._path("catalog", f"{key}.json")
+
+        ok, catalog = await self._async_job(self._load_catalog, file_path)
+        if not ok:
+            return await fetch(url)
+        if catalog is not None:
+            return catalog
+
+        lock_file = await self._async_lock(f"catalog-{key}")
+        if lock_file is None:
+            return await fetch(url)
+
+        try:
+            # Another instance may have refreshed it while we waited.
+            ok, catalog = await self._async_job(self._load_catalog, file_path)
+            if catalog is not None:
+                return catalog
+
+            catalog = await fetch(url)
+            if ok and catalog is not None:
+                await self._async_job(self._save_catalog, file_path, catalog)
+            return catalog
+        finally:
+            await self.hass.async_add_executor_job(self._unlock, lock_file)
+
+    def _copy_asset(self, cached_path: str, file_path: str) -> str | None:
+        digest = self._verified(cached_path)
+        if digest is not None:
+            shutil.copyfile(cached_path, file_path)
+        return digest
+
+    def _store_asset(self, file_path: str, cached_path: str, digest: str) -> None:
+        version_dir = os.path.dirname(cached_path)
+        os.makedirs(version_dir, exist_ok=True)
+        part_path = f"{cached_path}.{os.getpid()}.part"
+        try:
+            shutil.copyfile(file_path, part_path)
+            os.replace(part_path, cached_path)
+        finally:
+            _remove_file(part_path)
+        _write_text(f"{cached_path}.sha256", digest)
+        self._prune_versions(os.path.dirname(version_dir))
+
+    def _prune_versions(self, group_dir: str) -> None:
+        """Keep only the newest ASSET_KEEP_VERSIONS versions of a repo."""
+        version_dirs = [os.path.join(group_dir, name) for name in os.listdir(group_dir)]
+        version_dirs = sorted(
+            (path for path in version_dirs if os.path.isdir(path)),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for path in version_dirs[ASSET_KEEP_VERSIONS:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    async def async_get_asset(
+        self,
+        group: str,
+        url: str,
+        file_path: str,
+        download: Callable[[str, str], Awaitable[str | None]],
+    ) -> str | None:
+        """Copy the asset at url to file_path and return its sha256 digest.
+
+        Assets are grouped by repo, group, and asset urls are versioned. Storing
+        a new version prunes all but the newest ASSET_KEEP_VERSIONS of its
+        group. An unusable cache directory falls back to downloading directly.
+        """
+        key = _url_key(group)
+        cached_path = self._path("assets", key, _url_key(url), os.path.basename(file_path))
+
+        ok, digest = await self._async_job(self._copy_asset, cached_path, file_path)
+        if not ok:
+            return await download(url, file_path)
+        if digest is not None:
+            return digest
+
+        lock_file = await self._async_lock(f"asset-{key}")
+        if lock_file is None:
+            return await download(url, file_path)
+
+        try:
+            ok, digest = await self._async_job(self._copy_asset, cached_path, file_path)
+            if digest is not None:
+                return digest
+
+            # Download straight to file_path so a failing cache write never costs a retry.
+            digest = await download(url, file_path)
+            if ok and digest is not None:
+                await self._async_job(self._store_asset, file_path, cached_path, digest)
+            return digest
+        finally:
+            await self.hass.async_add_executor_job(self._unlock, lock_file)
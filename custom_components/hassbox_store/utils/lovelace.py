@@ -0,0 +1,106 @@
+"""Lovelace resource handlers."""
+from homeassistant.core import HomeAssistant
+from homeassistant.util.uuid import random_uuid_hex
+
+from ..const import CARD_URL_PATH
+from .logger import LOGGER
+from .store import async_load_from_store, async_save_to_store
+
+_LOGGER = LOGGER
+
+LOVELACE_DOMAIN = "lovelace"
+RESOURCE_TYPE = "module"
+CARD_URL_PREFIXES = ("/local/", CARD_URL_PATH + "/")
+
+
+def get_resource_key(url: str) -> str:
+    """Return the resource url without its cache-busting query and card prefix.
+
+    Cards can be served from /local or from the store's static path, both
+    forms of the same card share one key.
+    """
+    url = url.split("?")[0]
+    for prefix in CARD_URL_PREFIXES:
+        if url.startswith(prefix):
+            return url[len(prefix):]
+    return url
+
+
+def get_resource_collection(hass: HomeAssistant):
+    """Return the running lovelace resource collection if it is editable."""
+    lovelace = hass.data.get(LOVELACE_DOMAIN)
+    if lovelace is None:
+        return None
+
+    resources = getattr(lovelace, "resources", None)
+    if resources is None and isinstance(lovelace, dict):
+        resources = lovelace.get("resources")
+
+    # YAML mode resources can not be edited at runtime.
+    if resources is None or not hasattr(resources, "async_create_item"):
+        return None
+
+    return resources
+
+
+async def async_update_resources(
+    hass: HomeAssistant,
+    upserts: dict[str, str] | None = None,
+    removals: set[str] | None = None,
+) -> None:
+    """Apply a batch of resource changes in one pass.
+
+    upserts maps a resource url to its versioned url, removals holds the
+    resource urls to drop. Items whose url is already up to date are left alone.
+    """
+    upserts = {get_resource_key(url): value for url, value in (upserts or {}).items()}
+    removals = {get_resource_key(url) for url in removals or ()}
+    if not upserts and not removals:
+        return
+
+    resources = get_resource_collection(hass)
+    if resources is not None:
+        await _async_update_collection(resources, upserts, removals)
+    else:
+        await _async_update_store(hass, upserts, removals)
+
+
+async def _async_update_collection(resources, upserts, removals):
+    """Update the live resource collection so lovelace sees it without a restart."""
+    if not getattr(resources, "loaded", True):
+        await resources.async_load()
+        resources.loaded = True
+
+    for item in list(resources.async_items()):
+        key = get_resource_key(item["url"])
+        if key in removals:
+            await resources.async_delete_item(item["id"])
+        elif key in upserts:
+            url = upserts.pop(key)
+            if item["url"] != url:
+                await resources.async_update_item(
+                    item["id"], {"res_type": RESOURCE_TYPE, "url": url}
+                )
+
+    for url in upserts.values():
+        await resources.async_create_item({"res_type": RESOURCE_TYPE, "url": url})
+
+
+async def _async_update_store(hass, upserts, removals):
+    """Fallback for when lovelace is not loaded: edit the storage file."""
+    _LOGGER.debug("Lovelace resources not loaded, writing lovelace_resources store")
+    lovelace_resources = await async_load_from_store(hass, "lovelace_resources") or {}
+    items = []
+    for item in lovelace_resources.get("items") or []:
+        key = get_resource_key(item["url"])
+        if key in removals:
+            continue
+        if key in upserts:
+            item["url"] = upserts.pop(key)
+        items.append(item)
+
+    for url in upserts.values():
+        items.append({"id": random_uuid_hex(), "type": RESOURCE_TYPE, "url": url})
+
+    lovelace_resources["items"] = items
+    await async_save_to_store(hass, "lovelace_resources", lovelace_resources)
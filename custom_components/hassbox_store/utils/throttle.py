@@ -0,0 +1,55 @@
+"""Shared I/O throttling."""
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import time
+
+from ..const import DOWNLOAD_CHUNK_SIZE
+
+
+class IOThrottle:
+    """Cap the combined download and disk write speed of a batch.
+
+    reserve() books a slot for size bytes and returns how long the caller has
+    to wait before using it, so async and executor code can share one budget.
+    """
+
+    def __init__(self, rate: int) -> None:
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, size: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + size / self.rate
+            return start - now
+
+    def consume(self, size: int) -> None:
+        """Blocking variant of reserve for executor jobs."""
+        delay = self.reserve(size)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def copy_file(src: str, dst: str, throttle: IOThrottle | None = None) -> str:
+    """shutil.copy2 replacement that writes through the throttle."""
+    if throttle is None:
+        return shutil.copy2(src, dst)
+
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    with open(src, "rb") as f_in, open(dst, "wb") as f_out:
+        for chunk in iter(lambda: f_in.read(DOWNLOAD_CHUNK_SIZE), b""):
+            throttle.consume(len(chunk))
+            f_out.write(chunk)
+    shutil.copystat(src, dst)
+    return dst
+
+
+def move(src: str, dst: str, throttle: IOThrottle | None = None) -> str:
+    """shutil.move that throttles the copy done across filesystems."""
+    return shutil.move(src, dst, copy_function=lambda s, d: copy_file(s, d, throttle))
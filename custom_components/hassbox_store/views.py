@@ -0,0 +1,45 @@
+"""HTTP views for installed cards."""
+from __future__ import annotations
+
+from pathlib import Path
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant
+
+from .const import CARD_URL_PATH
+
+# Card urls carry a content hash in ?tag=, so a tagged response never changes.
+IMMUTABLE_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+NO_CACHE_HEADERS = {"Cache-Control": "no-cache"}
+
+
+class HassBoxCardView(HomeAssistantView):
+    """Serve installed cards from the www directory with long-lived cache headers."""
+
+    url = CARD_URL_PATH + "/{path:.+}"
+    name = "hassbox_store:card"
+    requires_auth = False
+
+    def __init__(self, hass: HomeAssistant, directory: str) -> None:
+        self.hass = hass
+        self.directory = Path(directory)
+
+    def _get_file_path(self, path: str) -> Path | None:
+        directory = self.directory.resolve()
+        file_path = (directory / path).resolve()
+        if not file_path.is_relative_to(directory) or not file_path.is_file():
+            return None
+        return file_path
+
+    async def get(self, request: web.Request, path: str) -> web.StreamResponse:
+        file_path = await self.hass.async_add_executor_job(self._get_file_path, path)
+        if file_path is None:
+            raise web.HTTPNotFound()
+
+        if "tag" in request.query:
+            headers = IMMUTABLE_CACHE_HEADERS
+        else:
+            headers = NO_CACHE_HEADERS
+        return web.FileResponse(file_path, headers=headers)